@@ -0,0 +1,22 @@
+import importlib.util
+import io
+
+import pandas as pd
+
+# The calamine engine needs the optional python-calamine package and pandas 2.2+
+CALAMINE_AVAILABLE = (
+    importlib.util.find_spec('python_calamine') is not None
+    and tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2)
+)
+
+
+# Function to pick the fastest installed reader engine
+def choose_excel_engine():
+    if CALAMINE_AVAILABLE:
+        return 'calamine'
+    return 'openpyxl'
+
+
+# Function to read all sheets of an Excel file with the given engine
+def read_excel_sheets(file_bytes, engine):
+    return pd.read_excel(io.BytesIO(file_bytes), sheet_name=None, engine=engine)
@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
+from plotly.colors import qualitative
 from PIL import Image
 import re
 import bcrypt
 import streamlit_authenticator as stauth
+from excel_readers import choose_excel_engine, read_excel_sheets
 
 # Load the image
 logo = Image.open("hf_logo.png")
@@ -63,11 +66,12 @@ if authentication_status:
     # Function to read and process Excel data
     @st.cache_data
     def read_excel_data(uploaded_file):
-        sheets_dict = pd.read_excel(uploaded_file, sheet_name=None)
-        combined_df = pd.DataFrame()
+        file_bytes = uploaded_file.getvalue()
+        sheets_dict = read_excel_sheets(file_bytes, choose_excel_engine())
         for sheet_name, df in sheets_dict.items():
             df['Sheet'] = sheet_name
-            combined_df = pd.concat([combined_df, df], ignore_index=True)
+        # Concatenate once instead of growing the combined frame sheet by sheet
+        combined_df = pd.concat(sheets_dict.values(), ignore_index=True) if sheets_dict else pd.DataFrame()
         return sheets_dict, combined_df
 
     # Function to sanitize sheet names
@@ -75,6 +79,102 @@ if authentication_status:
         sanitized_name = re.sub(r'[\\/*?:\[\]]', '', sheet_name)
         return sanitized_name[:31]  # Truncate to 31 characters
 
+    # Function to summarise every channel in one pass over the file, computed once per file and cycle column
+    @st.cache_data
+    def build_channel_index(combined_df, cycle_time_column):
+        channels = combined_df.drop(columns=['Sheet'], errors='ignore')
+        numeric = channels.apply(pd.to_numeric, errors='coerce')
+        present_counts = channels.notna().sum()
+        channel_index = pd.DataFrame({
+            'Numeric Fraction': numeric.notna().sum() / present_counts.where(present_counts > 0),
+            'NaN Rate': channels.isna().mean(),
+            'Range': numeric.max() - numeric.min(),
+            'Variance': numeric.var(),
+            'Cycle Correlation': numeric.corrwith(numeric[cycle_time_column]) if cycle_time_column in numeric else np.nan,
+        })
+        channel_index.index.name = 'Channel'
+        return channel_index.fillna({'Numeric Fraction': 0})
+
+    # Share of non-empty values that must be numeric for a column to be offered as a channel
+    NUMERIC_CHANNEL_FRACTION = 0.9
+
+    # Ranking options for the channel selectboxes: summary column and sort direction
+    CHANNEL_RANKINGS = {
+        'Original order': (None, True),
+        'Variance': ('Variance', False),
+        'Range': ('Range', False),
+        'Correlation with cycle time': ('Cycle Correlation', False),
+        'NaN rate': ('NaN Rate', True),
+    }
+
+    # Function to search the numeric channels by name and rank them using the summary index
+    def rank_channels(channel_index, search_text, rank_by):
+        candidates = channel_index[channel_index['Numeric Fraction'] >= NUMERIC_CHANNEL_FRACTION]
+        if search_text:
+            candidates = candidates[candidates.index.astype(str).str.contains(search_text, case=False, regex=False)]
+        column, ascending = CHANNEL_RANKINGS[rank_by]
+        if column is None:
+            return candidates.index.tolist()
+        scores = candidates[column].abs()  # Rank correlations by strength, not sign
+        return scores.sort_values(ascending=ascending, na_position='last', kind='stable').index.tolist()
+
+    # Consecutive out-of-band cycles needed before a sheet counts as diverging from the envelope
+    DIVERGENCE_MIN_CYCLES = 5
+
+    # Conforming sheets are thinned to roughly this many points per trace
+    MAX_CONFORMING_POINTS = 200
+
+    # Function to score every sheet against the per-cycle mean ± 1 std envelope in one vectorized pass
+    def score_sheet_deviations(filtered_df, selected_column):
+        values = filtered_df[['Sheet', 'New Cycle Time', selected_column]].copy()
+        values[selected_column] = pd.to_numeric(values[selected_column], errors='coerce')
+        values = values.dropna()
+
+        # Z-score of every point against the mean and std of its cycle across all sheets
+        by_cycle = values.groupby('New Cycle Time')[selected_column]
+        cycle_std = by_cycle.transform('std')
+        z_scores = (values[selected_column] - by_cycle.transform('mean')) / cycle_std.where(cycle_std > 0)
+        outside = z_scores.abs() > 1
+
+        # Label runs of in/out-of-band points over consecutive cycles of each sheet and keep the long out-of-band runs
+        run_breaks = (outside != outside.shift()) | (values['Sheet'] != values['Sheet'].shift()) | (values['New Cycle Time'].diff() != 1)
+        run_id = run_breaks.cumsum()
+        run_length = run_id.map(run_id.value_counts())
+        diverging = outside & (run_length >= DIVERGENCE_MIN_CYCLES)
+
+        by_sheet = pd.DataFrame({
+            'Sheet': values['Sheet'],
+            'Z Squared': z_scores ** 2,
+            'Outside Band': outside,
+            'Diverging Cycle': values['New Cycle Time'].where(diverging),
+        }).groupby('Sheet')
+        deviation_scores = pd.DataFrame({
+            'RMS Z-Score': np.sqrt(by_sheet['Z Squared'].mean()),
+            'Fraction Outside Band': by_sheet['Outside Band'].mean(),
+            'First Divergent Cycle': by_sheet['Diverging Cycle'].min(),
+        })
+        return deviation_scores.sort_values('RMS Z-Score', ascending=False, na_position='last')
+
+    # Channels whose ranges lie within this many decades of each other share a y-axis
+    AXIS_SCALE_DECADES = 1.0
+
+    # Horizontal space reserved for each extra y-axis beyond the second
+    AXIS_OFFSET = 0.08
+
+    AXIS_COLORS = ['blue', 'red', 'green', 'purple', 'orange', 'brown', 'teal']
+
+    # Function to group channels into y-axes by clustering the order of magnitude of their ranges
+    def group_channels_by_scale(ranges):
+        log_ranges = np.log10(ranges.where(ranges > 0)).sort_values(ascending=False, na_position='last')
+        axis_groups = []
+        for channel, log_range in log_ranges.items():
+            # Largest range first; start a new axis once a channel drops too far below the current one
+            if axis_groups and (pd.isna(log_range) or axis_groups[-1][0] - log_range <= AXIS_SCALE_DECADES):
+                axis_groups[-1][1].append(channel)
+            else:
+                axis_groups.append((log_range, [channel]))
+        return [group for _, group in axis_groups]
+
     # Upload the Excel file
     uploaded_file = st.file_uploader("Choose an Excel file", type="xlsx")
 
@@ -135,6 +235,9 @@ if authentication_status:
                     # Store the selected data in session state
                     st.session_state.selected_data = selected_data
 
+                # User input for the number of outlier sheets to highlight in the graph
+                top_k = st.number_input("Number of outlier sheets to highlight", min_value=0, value=5, step=1)
+
                 # Button to show the graph
                 if st.button('Show Graph'):
                     cleaned_df = filtered_df[[selected_column, 'New Cycle Time']].dropna()
@@ -145,15 +248,26 @@ if authentication_status:
                     median_values = grouped.median().reset_index()
                     std_values = grouped.std().reset_index()
 
+                    # Rank sheets by how far they deviate from the envelope and mark the top outliers
+                    deviation_scores = score_sheet_deviations(filtered_df, selected_column)
+                    outlier_sheets = deviation_scores.index[:top_k].tolist()
+                    deviation_scores['Outlier'] = deviation_scores.index.isin(outlier_sheets)
+
                     # Create a Plotly figure
                     fig = go.Figure()
 
-                    # Add data trace for each sheet
-                    for sheet_name, df in sheets_dict.items():
-                        filtered_sheet_df = df[df[step_number_column] >= step_value + 1].dropna(subset=[selected_column, cycle_time_column])
-                        if not filtered_sheet_df.empty:
-                            filtered_sheet_df['New Cycle Time'] = filtered_sheet_df.groupby('Sheet').cumcount()
-                            fig.add_trace(go.Scatter(x=filtered_sheet_df['New Cycle Time'], y=filtered_sheet_df[selected_column], mode='lines', line=dict(color='blue'), showlegend=False))
+                    # Add data trace for each sheet from the same rows that were scored, keeping outliers aside so they are drawn on top
+                    outlier_traces = []
+                    for sheet_name, filtered_sheet_df in filtered_df.groupby('Sheet', sort=False):
+                        if sheet_name in outlier_sheets:
+                            color = qualitative.Dark24[outlier_sheets.index(sheet_name) % len(qualitative.Dark24)]
+                            outlier_traces.append(go.Scatter(x=filtered_sheet_df['New Cycle Time'], y=filtered_sheet_df[selected_column], mode='lines', name=f'Outlier: {sheet_name}', line=dict(color=color)))
+                        else:
+                            # Decimate conforming sheets, they only need to show the shape of the bundle
+                            decimated_df = filtered_sheet_df.iloc[::max(1, len(filtered_sheet_df) // MAX_CONFORMING_POINTS)]
+                            fig.add_trace(go.Scatter(x=decimated_df['New Cycle Time'], y=decimated_df[selected_column], mode='lines', line=dict(color='blue'), opacity=0.3 if outlier_sheets else 1, showlegend=False))
+                    for trace in outlier_traces:
+                        fig.add_trace(trace)
 
                     # Add mean, median, and std deviation lines
                     fig.add_trace(go.Scatter(x=mean_values['New Cycle Time'], y=mean_values[selected_column], mode='lines', name='Overall mean', line=dict(color='red', dash='dash')))
@@ -172,22 +286,35 @@ if authentication_status:
                         height=700,
                         font=dict(size=16)
                     )
-                    # Store the plot in session state
+                    # Store the plot and the deviation ranking in session state
                     st.session_state.plot = fig
+                    st.session_state.deviation_scores = deviation_scores
 
                 # Mean Graphs Setting section
                 st.markdown("### Mean Graphs Setting")
-                
+
+                # Summary of every channel, used for search, ranking and axis grouping
+                channel_index = build_channel_index(combined_df, cycle_time_column)
+                with st.expander("Channel summary"):
+                    st.dataframe(channel_index)
+
+                # Search and rank the numeric channels offered in the selectboxes
+                search_text = st.text_input("Search channels", "")
+                rank_by = st.selectbox("Rank channels by", list(CHANNEL_RANKINGS))
+                ranked_channels = rank_channels(channel_index, search_text, rank_by)
+
                 # User input for the number of fields
                 num_fields = st.slider("How many fields do you want to analyze?", min_value=1, max_value=7, value=1)
 
                 selected_columns = []
                 for i in range(num_fields):
-                    selected_columns.append(st.selectbox(f"Choose Parameter {i+1}", columns, key=f"col_{i}"))
+                    selected_columns.append(st.selectbox(f"Choose Parameter {i+1}", ranked_channels, key=f"col_{i}"))
 
                 # Button to show the graph for selected variables
                 if st.button('Show Graph for Selected Variables'):
-                    if len(selected_columns) != len(set(selected_columns)):
+                    if not ranked_channels:
+                        st.error("No numeric channels match the search.")
+                    elif len(selected_columns) != len(set(selected_columns)):
                         st.error("Please select unique parameters for all fields.")
                     else:
                         # Ensure all columns have the same length by dropping rows with NaNs
@@ -205,43 +332,48 @@ if authentication_status:
                         # Group by new cycle time and calculate mean values
                         grouped = cleaned_df.groupby('New Cycle Time').mean().reset_index()
 
-                        # Determine the range for each selected column
-                        column_ranges = {column: (grouped[column].max() - grouped[column].min()) for column in selected_columns}
-
-                        # Sort columns by range in descending order
-                        sorted_columns = sorted(column_ranges, key=column_ranges.get, reverse=True)
+                        # Assign one y-axis per scale cluster of the plotted mean curves, largest range first
+                        mean_ranges = grouped[selected_columns].max() - grouped[selected_columns].min()
+                        axis_groups = group_channels_by_scale(mean_ranges)
 
                         # Create a Plotly figure for selected variables
                         fig_selected = go.Figure()
 
-                        # Add traces for each selected column, dynamically setting the axis based on the range
-                        for i, column in enumerate(sorted_columns):
-                            axis = 'y1' if i == 0 else 'y2'
-                            fig_selected.add_trace(go.Scatter(
-                                x=grouped['New Cycle Time'],
-                                y=grouped[column],
-                                mode='lines',
-                                name=f'Mean {column}',
-                                yaxis=axis
-                            ))
+                        # Add traces for each selected column on the axis of its scale cluster
+                        for axis_number, axis_channels in enumerate(axis_groups, start=1):
+                            for column in axis_channels:
+                                fig_selected.add_trace(go.Scatter(
+                                    x=grouped['New Cycle Time'],
+                                    y=grouped[column],
+                                    mode='lines',
+                                    name=f'Mean {column}',
+                                    yaxis='y' if axis_number == 1 else f'y{axis_number}'
+                                ))
+
+                        # Build one y-axis layout per cluster; axes beyond the second are stacked on the right
+                        right_edge = 1 - AXIS_OFFSET * max(len(axis_groups) - 2, 0)
+                        axis_layouts = {}
+                        for axis_number, axis_channels in enumerate(axis_groups, start=1):
+                            color = AXIS_COLORS[(axis_number - 1) % len(AXIS_COLORS)]
+                            axis_layout = dict(
+                                title=', '.join(str(column) for column in axis_channels),
+                                titlefont=dict(color=color),
+                                tickfont=dict(color=color)
+                            )
+                            if axis_number == 1:
+                                axis_layout['side'] = 'left'
+                                axis_layouts['yaxis'] = axis_layout
+                            else:
+                                axis_layout.update(overlaying='y', side='right')
+                                if axis_number > 2:
+                                    axis_layout.update(anchor='free', position=right_edge + AXIS_OFFSET * (axis_number - 2))
+                                axis_layouts[f'yaxis{axis_number}'] = axis_layout
 
                         # Update layout for multiple y-axes
                         fig_selected.update_layout(
                             title=f'<b>Mean Values of Selected Parameters across all sheets</b>',
                             xaxis_title=cycle_time_column,
-                            yaxis=dict(
-                                title=sorted_columns[0],
-                                titlefont=dict(color="blue"),
-                                tickfont=dict(color="blue"),
-                                side='left'
-                            ),
-                            yaxis2=dict(
-                                title=sorted_columns[1] if len(sorted_columns) > 1 else "",
-                                titlefont=dict(color="red"),
-                                tickfont=dict(color="red"),
-                                overlaying='y',
-                                side='right'
-                            ),
+                            xaxis_domain=[0, right_edge],
                             legend=dict(
                                 x=1.05,
                                 y=1,
@@ -252,7 +384,8 @@ if authentication_status:
                             autosize=True,
                             width=900,
                             height=700,
-                            font=dict(size=16)
+                            font=dict(size=16),
+                            **axis_layouts
                         )
 
                         # Store the plot in session state
@@ -271,6 +404,11 @@ if authentication_status:
             if 'plot' in st.session_state:
                 st.plotly_chart(st.session_state.plot, use_container_width=True)
 
+            # Display the sheet deviation ranking if available
+            if 'deviation_scores' in st.session_state and not st.session_state.deviation_scores.empty:
+                st.markdown(f'<h3 style="color: navy; font-size: 18px;"><b>Sheet Deviation Ranking: {selected_column}</b></h3>', unsafe_allow_html=True)
+                st.dataframe(st.session_state.deviation_scores)
+
             # Display the graph for selected variables if available
             if 'plot_selected' in st.session_state:
                 st.plotly_chart(st.session_state.plot_selected, use_container_width=True)
@@ -0,0 +1,78 @@
+import io
+import time
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_readers import CALAMINE_AVAILABLE, choose_excel_engine, read_excel_sheets
+
+requires_calamine = pytest.mark.skipif(not CALAMINE_AVAILABLE, reason="python-calamine is not installed")
+
+
+# Function to build an xlsx file in memory from a dict of sheet name -> rows
+def make_workbook(sheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, rows in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        for row in rows:
+            worksheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def mixed_workbook():
+    return make_workbook({
+        'Run 1': [
+            ['Cycle', 'Step', 'Pressure', 'Pressure', None, 'Status'],
+            [0, 1, 1.5, 10, 2.0, 'ok'],
+            [1, 1, '#DIV/0!', 11, 3.0, None],
+            [2, 2, 2.5, '#REF!', 4.0, 'ok'],
+            [3, 2, 3.0, 13, None, 'fault'],
+        ],
+        'Run 2': [
+            ['Cycle', 'Step', 'Pressure'],
+            [0, 1, 1.0],
+            [1, 1, 2.0, None, None],
+            [None, None, None],
+            [2, 2, 3.0],
+            [None, None, None],
+        ],
+    })
+
+
+@pytest.mark.parametrize('engine', [pytest.param('calamine', marks=requires_calamine)])
+def test_engines_match_openpyxl(mixed_workbook, engine):
+    expected = read_excel_sheets(mixed_workbook, 'openpyxl')
+    result = read_excel_sheets(mixed_workbook, engine)
+    assert list(result) == list(expected)
+    for sheet_name, df in expected.items():
+        pd.testing.assert_frame_equal(result[sheet_name], df)
+
+
+@pytest.mark.parametrize('engine', ['openpyxl', pytest.param('calamine', marks=requires_calamine)])
+def test_error_cells_read_as_nan(mixed_workbook, engine):
+    df = read_excel_sheets(mixed_workbook, engine)['Run 1']
+    assert df['Pressure'].dtype == float
+    assert df['Pressure'].isna().tolist() == [False, True, False, False]
+
+
+@requires_calamine
+def test_chosen_engine_is_faster_than_openpyxl():
+    rows = [['Cycle', 'Step'] + [f'Channel {i}' for i in range(20)]]
+    rows += [[cycle, cycle // 100] + [cycle * 0.5 + i for i in range(20)] for cycle in range(2000)]
+    file_bytes = make_workbook({'Run 1': rows, 'Run 2': rows})
+
+    def best_time(engine):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            read_excel_sheets(file_bytes, engine)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    assert choose_excel_engine() == 'calamine'
+    assert best_time('calamine') < best_time('openpyxl')